@@ -1,12 +1,45 @@
+import argparse
+import bisect
+import csv
+import ctypes
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import random
 import socket
 import sys
-from datetime import datetime, time
+import threading
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+from time import monotonic, perf_counter, sleep
+from urllib.parse import parse_qs, urlparse
 
 import cv2
+import numpy as np
 import psycopg2
+from psycopg2.extras import execute_values
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill
-from PySide6.QtCore import QDate, QRegularExpression, Qt, QThread, QTimer, Signal
+from PySide6.QtCore import (
+    QDate,
+    QObject,
+    QRegularExpression,
+    Qt,
+    QThread,
+    QTimer,
+    Signal,
+)
 from PySide6.QtGui import QColor, QImage, QPixmap, QRegularExpressionValidator
 from PySide6.QtWidgets import (
     QApplication,
@@ -19,6 +52,7 @@ from PySide6.QtWidgets import (
     QHeaderView,
     QLabel,
     QLineEdit,
+    QProgressDialog,
     QPushButton,
     QSizePolicy,
     QStackedWidget,
@@ -43,15 +77,333 @@ DB = dict(
 )
 TABLE = "camera_inspection"
 last_data=None
+
+# ================= ARCHIVE CONFIG =================
+ARCHIVE_DIR = "archive"
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_FIELDS = [
+    "id",
+    "employee_id",
+    "work_order",
+    "charge_no",
+    "serial_no",
+    "part_no",
+    "unique_no",
+    "status",
+    "time",
+    "phash",
+    "duplicate_of",
+    "offset",
+    "length",
+]
+
+# ================= RE-INSPECTION CONFIG =================
+REINSPECT_TABLE = "camera_reinspection"
+REINSPECT_RUNS = "camera_reinspection_run"
+REINSPECT_BATCH = 64
+SHARPNESS_MIN = 100.0
+
+# ================= CACHE CONFIG =================
+CACHE_DAYS = 7
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_SYNC_SEC = 5  # pick up rows saved by other stations
+# Ids are taken at INSERT but show up at COMMIT, so another station can
+# commit a lower id after a higher one; every sync re-reads this many ids
+CACHE_SYNC_BACK_IDS = 256
+CACHE_TEXT = (
+    "employee_id",
+    "work_order",
+    "charge_no",
+    "serial_no",
+    "part_no",
+    "unique_no",
+)
+STATUS_CODES = {"OK": 1, "NOT_OK": 2}
+
+# ================= WATCHDOG CONFIG =================
+STALL_LOG = "stalls.log"
+HEARTBEAT_MS = 50
+STALL_MS = 250
+STALL_SAMPLE_MS = 10
+
+# ================= EVIDENCE CONFIG =================
+EVIDENCE_CHUNK = 100  # rows per DB fetch
+EVIDENCE_QUEUE = 4  # fetched chunks waiting for the ZIP writer
+
+# ================= DUPLICATE CONFIG =================
+DEDUP_WINDOW_MIN = 30  # only compare with captures of the same part this recent
+DEDUP_MAX_DISTANCE = 6  # Hamming distance (of 64 bits) that counts as the same
+# Same part, same picture, same decision: don't store it again
+DEDUP_SKIP_SAME_STATUS = True
+
+# ================= ANALYTICS CONFIG =================
+ROLLUP = "camera_inspection_hourly"
+YIELD_DAYS = 30
+# (name, start hour, end hour); a shift may wrap past midnight
+SHIFTS = [("A", 6, 14), ("B", 14, 22), ("C", 22, 6)]
+
+# ================= ACQUISITION CONFIG =================
+# Camera index, video file/URL, or a folder of .jpg files (test source)
+CAMERA_SOURCE = os.environ.get("INSPECTION_CAMERA", "1")
+# cv2.CAP_<name>: DSHOW, MSMF, V4L2, FFMPEG, ANY ...
+CAMERA_BACKEND = os.environ.get("INSPECTION_CAMERA_BACKEND", "DSHOW")
+# Ask for MJPG and keep the camera's own JPEG instead of decode + re-encode
+CAMERA_MJPEG = os.environ.get("INSPECTION_CAMERA_MJPEG", "1") == "1"
+FILE_SOURCE_FPS = 10
+# Preview is decoded at 1/PREVIEW_SCALE size (1, 2, 4 or 8)
+PREVIEW_SCALE = 2
+FRAME_SLOTS = 4
+FRAME_MAX_W, FRAME_MAX_H = 1920, 1080
+SLOT_BYTES = FRAME_MAX_W * FRAME_MAX_H * 3
+# Shared memory header (int64): latest seq, worker heartbeat (ms),
+# then seq/h/w for every slot. Slot seq is -1 while it is being written.
+HEADER_LEN = 2 + 3 * FRAME_SLOTS
+HEADER_BYTES = HEADER_LEN * 8
+WORKER_STALL_SEC = 5
+WORKER_RESTART_SEC = 2
+CAPTURE_TIMEOUT_SEC = 5
+
+# ================= METRICS =================
+# Prometheus text exposition on http://METRICS_HOST:METRICS_PORT/metrics.
+# Updates take a per-metric lock, so any thread may update a metric (worker
+# counters are bumped on the socket thread while the worker loop drains
+# them). Scrapes read a snapshot without the lock.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS = {}
+DB_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_str(names, values, extra=""):
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {} if labelnames else {(): 0}
+        self.lock = threading.Lock()
+        METRICS[name] = self
+
+    def inc(self, *labels, n=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def drain(self):
+        # Hand the counts accumulated so far to the caller (worker → GUI)
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def lines(self):
+        return [
+            f"{self.name}{_label_str(self.labelnames, k)} {v}"
+            for k, v in list(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn  # evaluated at scrape time, returns {labels: value}
+
+    def set(self, v, *labels):
+        self.values[labels] = v
+
+    def lines(self):
+        if self.fn:
+            self.values.update(self.fn())
+        return super().lines()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DB_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+        METRICS[name] = self
+
+    def observe(self, v, *labels):
+        with self.lock:
+            h = self.values.get(labels)
+            if h is None:
+                h = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[bisect.bisect_left(self.buckets, v)] += 1
+            h[-1] += v
+
+    def lines(self):
+        out = []
+        for k, h in list(self.values.items()):
+            acc = 0
+            for le, c in zip((*self.buckets, "+Inf"), h[:-1]):
+                acc += c
+                labels = _label_str(self.labelnames, k, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{labels} {acc}")
+            out.append(f"{self.name}_count{_label_str(self.labelnames, k)} {acc}")
+            out.append(f"{self.name}_sum{_label_str(self.labelnames, k)} {h[-1]}")
+        return out
+
+
+def _rss_bytes():
+    if sys.platform == "win32":
+
+        class PMC(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.c_ulong),
+                ("PageFaultCount", ctypes.c_ulong),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        pmc = PMC()
+        pmc.cb = ctypes.sizeof(PMC)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(pmc), pmc.cb
+        )
+        return pmc.WorkingSetSize
+
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def metrics_text():
+    out = []
+    for m in list(METRICS.values()):
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out += m.lines()
+    return "\n".join(out) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = metrics_text().encode()
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        elif url.path == "/yield":
+            # /yield?by=Shift&days=30 -> JSON rows from the rollup table
+            q = parse_qs(url.query)
+            by = q.get("by", ["Work Order"])[0]
+            if by not in YIELD_GROUPS:
+                self.send_error(400, "by must be one of " + ", ".join(YIELD_GROUPS))
+                return
+            to_dt = datetime.now()
+            try:
+                from_dt = to_dt - timedelta(days=int(q.get("days", [YIELD_DAYS])[0]))
+            except (ValueError, OverflowError):
+                self.send_error(400, "days must be a number of days")
+                return
+            try:
+                rows = [
+                    dict(key=str(k), total=t, ok=o, not_ok=n, not_ok_rate=r)
+                    for k, t, o, n, r in fetch_yield(from_dt, to_dt, by)
+                ]
+            except psycopg2.Error as e:
+                print("YIELD QUERY FAILED:", e)
+                self.send_error(500, "database error")
+                return
+            body = json.dumps(rows).encode()
+            ctype = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server():
+    try:
+        server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _MetricsHandler)
+    except OSError as e:
+        print("METRICS SERVER NOT STARTED:", e)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Counted in the acquisition worker and merged into the GUI process
+FHV_MESSAGES = Counter(
+    "inspection_fhv_messages_total", "FHV socket replies by kind", ("kind",)
+)
+FHV_RECONNECTS = Counter(
+    "inspection_fhv_reconnects_total", "FHV socket connection losses"
+)
+CAMERA_READ_FAILS = Counter(
+    "inspection_camera_read_failures_total", "cap.read() calls without a frame"
+)
+WORKER_COUNTERS = (FHV_MESSAGES, FHV_RECONNECTS, CAMERA_READ_FAILS)
+
+# GUI process
+TRIGGERS = Counter(
+    "inspection_triggers_total", "Capture triggers by source", ("source",)
+)
+CAPTURES = Counter("inspection_captures_total", "Frames captured and encoded")
+DECISIONS = Counter(
+    "inspection_decisions_total", "Operator decisions by status", ("status",)
+)
+DB_LATENCY = Histogram(
+    "inspection_db_seconds", "Database call latency by operation", ("op",)
+)
+FRAMES_DROPPED = Counter(
+    "inspection_frames_dropped_total", "Camera frames never shown in the preview"
+)
+PREVIEW_FPS = Gauge("inspection_preview_fps", "Frames shown in the preview per second")
+WORKER_RESTARTS = Counter(
+    "inspection_worker_restarts_total", "Acquisition worker restarts"
+)
+DUPLICATES = Counter(
+    "inspection_duplicates_total", "Near-duplicate captures by action", ("action",)
+)
+GUI_STALLS = Histogram(
+    "inspection_gui_stall_seconds",
+    "GUI event loop stalls longer than STALL_MS",
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+MEMORY = Gauge(
+    "inspection_memory_bytes",
+    "Resident memory by process",
+    ("process",),
+    fn=lambda: {("gui",): _rss_bytes()},
+)
+
 # ================= SOCKET THREAD (ADDED) =================
-class FHVSocketThread(QThread):
-    data_received = Signal(str)
-    def __init__(self):
-        super().__init__()          #  REQUIRED
+# Runs inside the acquisition worker; valid messages go to the GUI as events
+class FHVSocketThread(threading.Thread):
+    def __init__(self, events):
+        super().__init__(daemon=True)
+        self.events = events
         self.running = True         #  REQUIRED
         self.waiting_for_user = False
 
-
+    def msleep(self, ms):
+        sleep(ms / 1000)
 
     def run(self):
         HOST = "172.21.2.11"
@@ -83,19 +435,23 @@ class FHVSocketThread(QThread):
                     msg = msg.replace("\x00", "").strip()
 
                     if msg in ("ER", "OK", "0"):
+                        FHV_MESSAGES.inc("status")
                         continue
 
                     if len(msg) != 23 or not msg.isalnum():
+                        FHV_MESSAGES.inc("invalid")
                         continue
 
+                    FHV_MESSAGES.inc("valid")
                     print("VALID SOCKET:", msg)
 
                     self.waiting_for_user = True
                     self.msleep(3000)  # 3s delay
-                    self.data_received.emit(msg)
+                    self.events.put(("socket", msg))
 
             except Exception as e:
                 print("SOCKET LOST → RECONNECTING:", e)
+                FHV_RECONNECTS.inc()
                 try:
                     conn.close()
                 except:
@@ -118,6 +474,370 @@ class FHVSocketThread(QThread):
         self.waiting_for_user = True
 
 
+# ================= ACQUISITION WORKER =================
+def _shm_views(shm):
+    header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+    slots = [
+        np.ndarray(
+            (SLOT_BYTES,),
+            dtype=np.uint8,
+            buffer=shm.buf,
+            offset=HEADER_BYTES + i * SLOT_BYTES,
+        )
+        for i in range(FRAME_SLOTS)
+    ]
+    return header, slots
+
+
+def _mjpeg_passthrough(cap):
+    mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+    cap.set(cv2.CAP_PROP_FOURCC, mjpg)
+    # Only skip conversion once MJPG is really in use, otherwise the
+    # backend would hand out raw YUYV
+    if int(cap.get(cv2.CAP_PROP_FOURCC)) != mjpg:
+        return
+    if cap.getBackendName() == "FFMPEG":
+        cap.set(cv2.CAP_PROP_FORMAT, -1)  # raw packets from files/streams
+    else:
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+
+class FileSource:
+    # Test stand-in for a camera: a folder of JPEG files or a video file,
+    # looped and paced at FILE_SOURCE_FPS. JPEGs and MJPG video come out
+    # compressed, like an MJPG camera.
+    def __init__(self, path, fps=FILE_SOURCE_FPS):
+        self.files = self.cap = None
+        if os.path.isdir(path):
+            self.files = sorted(
+                os.path.join(path, f)
+                for f in os.listdir(path)
+                if f.lower().endswith((".jpg", ".jpeg"))
+            )
+        else:
+            self.cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+            if CAMERA_MJPEG:
+                _mjpeg_passthrough(self.cap)
+        self.period = 1 / fps
+        self.next_at = monotonic()
+        self.pos = 0
+
+    def isOpened(self):
+        return bool(self.files) or (self.cap is not None and self.cap.isOpened())
+
+    def read(self):
+        delay = self.next_at - monotonic()
+        if delay > 0:
+            sleep(delay)
+        self.next_at = max(self.next_at + self.period, monotonic())
+
+        if self.cap is not None:
+            ret, frame = self.cap.read()
+            if not ret:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.cap.read()
+            return ret, frame
+
+        with open(self.files[self.pos], "rb") as f:
+            buf = np.frombuffer(f.read(), dtype=np.uint8)
+        self.pos = (self.pos + 1) % len(self.files)
+        return True, buf.reshape(1, -1)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.files = self.cap = None
+
+
+def _open_camera(events):
+    if os.path.exists(CAMERA_SOURCE):
+        cap = FileSource(CAMERA_SOURCE)
+    else:
+        src = int(CAMERA_SOURCE) if CAMERA_SOURCE.isdigit() else CAMERA_SOURCE
+        backend = getattr(cv2, f"CAP_{CAMERA_BACKEND.upper()}", cv2.CAP_ANY)
+        cap = cv2.VideoCapture(src, backend)
+        if CAMERA_MJPEG and cap.isOpened():
+            _mjpeg_passthrough(cap)
+
+    if not cap.isOpened():
+        events.put(("status", "Camera not available"))
+        return None
+    return cap
+
+
+PREVIEW_DECODE = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _split_frame(raw):
+    # -> (camera JPEG buffer or None, BGR preview)
+    if raw.ndim < 3 and raw.size > 2 and raw.flat[0] == 0xFF and raw.flat[1] == 0xD8:
+        # libjpeg scales while decoding, so a reduced preview is cheap
+        return raw, cv2.imdecode(raw.reshape(-1), PREVIEW_DECODE[PREVIEW_SCALE])
+
+    if PREVIEW_SCALE > 1:
+        h, w = raw.shape[:2]
+        size = (w // PREVIEW_SCALE, h // PREVIEW_SCALE)
+        return None, cv2.resize(raw, size, interpolation=cv2.INTER_NEAREST)
+    return None, raw
+
+
+def dhash(img):
+    # 64-bit difference hash: 9x8 grayscale thumbnail, one bit per
+    # left/right brightness step. Stable under JPEG noise and small shifts.
+    g = cv2.imdecode(np.frombuffer(img, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if g is None:
+        return None
+    small = cv2.resize(g, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def acquisition_worker(shm_name, commands, events, camera_on, paused):
+    # Owns the camera, the FHV socket and all image work.
+    # Frames go to the GUI through shared memory, everything else as events.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header, slots = _shm_views(shm)
+
+    sock = FHVSocketThread(events)
+    sock.waiting_for_user = paused
+    sock.start()
+
+    cap = _open_camera(events) if camera_on else None
+    frame = jpeg = None  # last full frame: BGR, or the camera's JPEG
+    seq = int(header[0])
+    events.put(("ready",))
+    next_metrics = monotonic() + 1
+
+    try:
+        while True:
+            now = monotonic()
+            header[1] = int(now * 1000)
+
+            if now >= next_metrics:
+                next_metrics = now + 1
+                counts = {c.name: c.drain() for c in WORKER_COUNTERS}
+                events.put(("metrics", counts, _rss_bytes()))
+
+            # ---- commands from the GUI ----
+            stop = False
+            while True:
+                try:
+                    cmd, *args = commands.get_nowait()
+                except queue.Empty:
+                    break
+
+                if cmd == "stop":
+                    stop = True
+                elif cmd == "camera":
+                    if args[0] and cap is None:
+                        cap = _open_camera(events)
+                    elif not args[0] and cap is not None:
+                        cap.release()
+                        cap = None
+                        frame = jpeg = None
+                elif cmd == "pause":
+                    sock.pause()
+                elif cmd == "resume":
+                    sock.resume()
+                elif cmd == "capture":
+                    img_bytes = None
+                    if jpeg is not None:
+                        img_bytes = jpeg.tobytes()
+                    elif frame is not None:
+                        img_bytes = cv2.imencode(".jpg", frame)[1].tobytes()
+                    phash = dhash(img_bytes) if img_bytes else None
+                    events.put(("jpeg", img_bytes, phash))
+            if stop:
+                break
+
+            # ---- camera ----
+            if cap is None:
+                sleep(0.05)
+                continue
+
+            ret, raw = cap.read()
+            if not ret:
+                CAMERA_READ_FAILS.inc()
+                sleep(0.01)
+                continue
+
+            buf, img = _split_frame(raw)
+            if img is None:
+                CAMERA_READ_FAILS.inc()  # corrupt JPEG from the camera
+                continue
+            jpeg = buf
+            frame = None if buf is not None else raw
+
+            h, w = img.shape[:2]
+            if w > FRAME_MAX_W or h > FRAME_MAX_H:
+                scale = min(FRAME_MAX_W / w, FRAME_MAX_H / h)
+                w, h = int(w * scale), int(h * scale)
+                img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+
+            seq += 1
+            i = seq % FRAME_SLOTS
+            base = 2 + 3 * i
+            header[base] = -1
+            cv2.cvtColor(
+                img, cv2.COLOR_BGR2RGB, dst=slots[i][: h * w * 3].reshape(h, w, 3)
+            )
+            header[base + 1] = h
+            header[base + 2] = w
+            header[base] = seq
+            header[0] = seq
+    finally:
+        sock.stop()
+        if cap is not None:
+            cap.release()
+        header = slots = None
+        shm.close()
+
+
+# ================= ACQUISITION SUPERVISOR =================
+class AcquisitionProcess(QObject):
+    socket_data = Signal(str)
+    captured = Signal(object, object)  # jpeg bytes, perceptual hash
+    status = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=HEADER_BYTES + FRAME_SLOTS * SLOT_BYTES
+        )
+        self.header, self.slots = _shm_views(self.shm)
+        self.header[:] = 0
+
+        self.proc = self.commands = self.events = None
+        self.ready = False
+        self.started_at = 0
+        self.camera_on = False
+        self.paused = False
+        self.last_seq = 0
+        self.restarts = 0
+        self.capturing = False
+
+        # Drains worker events and restarts the worker if it dies or hangs
+        self.watch = QTimer(self)
+        self.watch.timeout.connect(self.poll)
+        self.watch.start(50)
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.commands = ctx.Queue()
+        self.events = ctx.Queue()
+        self.ready = False
+        self.started_at = monotonic()
+        self.proc = ctx.Process(
+            target=acquisition_worker,
+            args=(self.shm.name, self.commands, self.events, self.camera_on, self.paused),
+            daemon=True,
+        )
+        self.proc.start()
+
+    def stop(self):
+        self.watch.stop()
+        if self.proc is not None:
+            self.send("stop")
+            self.proc.join(2)
+            if self.proc.is_alive():
+                self.proc.kill()
+            self.proc = None
+        self.header = self.slots = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def send(self, *cmd):
+        if self.proc is not None:
+            self.commands.put(cmd)
+
+    def poll(self):
+        if self.proc is None:
+            return
+
+        while True:
+            try:
+                evt, *args = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if evt == "ready":
+                self.ready = True
+            elif evt == "socket":
+                self.socket_data.emit(args[0])
+            elif evt == "jpeg":
+                self.capturing = False
+                self.captured.emit(*args)
+            elif evt == "status":
+                self.status.emit(args[0])
+            elif evt == "metrics":
+                counts, rss = args
+                for name, values in counts.items():
+                    for labels, n in values.items():
+                        METRICS[name].inc(*labels, n=n)
+                MEMORY.set(rss, "worker")
+
+        # ---- supervision ----
+        if monotonic() - self.started_at < WORKER_RESTART_SEC:
+            return
+        hung = self.ready and monotonic() * 1000 - self.header[1] > WORKER_STALL_SEC * 1000
+        if self.proc.is_alive() and not hung:
+            return
+
+        print("ACQUISITION WORKER LOST → RESTARTING:", self.proc.exitcode)
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(1)
+        self.restarts += 1
+        WORKER_RESTARTS.inc()
+        if self.capturing:
+            # The capture command died with the worker
+            self.capturing = False
+            self.captured.emit(None, None)
+        self.start()
+
+    def set_camera(self, on):
+        self.camera_on = on
+        if self.proc is None:
+            self.start()
+        else:
+            self.send("camera", on)
+
+    def pause(self):
+        self.paused = True
+        self.send("pause")
+
+    def resume(self):
+        self.paused = False
+        self.send("resume")
+
+    def capture(self):
+        self.capturing = True
+        self.send("capture")
+
+    def latest_frame(self):
+        seq = int(self.header[0])
+        if seq <= 0 or seq == self.last_seq:
+            return None
+
+        i = seq % FRAME_SLOTS
+        base = 2 + 3 * i
+        if self.header[base] != seq:
+            return None
+        h, w = int(self.header[base + 1]), int(self.header[base + 2])
+        frame = self.slots[i][: h * w * 3].reshape(h, w, 3).copy()
+        if self.header[base] != seq:
+            return None  # worker lapped us while copying
+
+        if self.last_seq and seq > self.last_seq + 1:
+            FRAMES_DROPPED.inc(n=seq - self.last_seq - 1)
+        self.last_seq = seq
+        return frame
+
+
 
 
 # ================= DB INIT =================
@@ -140,21 +860,108 @@ def init_db():
         )
     """
     )
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_time_idx ON {TABLE} (time)")
+    cur.execute(
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_work_order_idx ON {TABLE} (work_order)"
+    )
+    # ALTER TABLE locks the table exclusively even when nothing changes
+    cur.execute(
+        """
+        SELECT count(*) FROM information_schema.columns
+        WHERE table_name = %s AND column_name IN ('phash', 'duplicate_of')
+    """,
+        (TABLE,),
+    )
+    if cur.fetchone()[0] < 2:
+        cur.execute(
+            f"""
+            ALTER TABLE {TABLE}
+                ADD COLUMN IF NOT EXISTS phash BIGINT,
+                ADD COLUMN IF NOT EXISTS duplicate_of INTEGER
+        """
+        )
+    cur.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS {TABLE}_part_idx
+        ON {TABLE} (unique_no, charge_no, time)
+    """
+    )
+    cur.execute("SELECT to_regclass(%s)", (ROLLUP,))
+    new_rollup = cur.fetchone()[0] is None
+    init_rollups(cur)
+    if new_rollup:
+        rebuild_rollups(cur)
     conn.commit()
     cur.close()
     conn.close()
 
 
 # ================= DB SAVE =================
-def save_record(data, status, img_bytes):
+def _signed64(h):
+    # BIGINT is signed; keep the same 64 bits
+    return h - (1 << 64) if h is not None and h >= 1 << 63 else h
+
+
+def find_duplicate(data, phash, cur=None):
+    # Same part key, captured recently, and a near-identical picture.
+    # The (unique_no, charge_no, time) index narrows this to a handful of
+    # rows, so it stays an index seek however big the table gets.
+    if phash is None:
+        return None
+
+    own = cur is None
+    if own:
+        conn = psycopg2.connect(**DB)
+        cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT id, phash, status, time
+        FROM {TABLE}
+        WHERE unique_no=%s AND charge_no=%s AND time >= %s
+          AND phash IS NOT NULL
+        ORDER BY time DESC
+        LIMIT 50
+    """,
+        (
+            data["unique"],
+            data["charge"],
+            datetime.now() - timedelta(minutes=DEDUP_WINDOW_MIN),
+        ),
+    )
+    rows = cur.fetchall()
+    if own:
+        cur.close()
+        conn.close()
+
+    for rid, h, st, t in rows:
+        if ((h & 0xFFFFFFFFFFFFFFFF) ^ phash).bit_count() <= DEDUP_MAX_DISTANCE:
+            return rid, st, t
+    return None
+
+
+def save_record(data, status, img_bytes, phash=None):
+    # Returns the new row id, or None when the capture was not stored
+    t0 = perf_counter()
     conn = psycopg2.connect(**DB)
     cur = conn.cursor()
+
+    dup = find_duplicate(data, phash, cur)
+    if dup and DEDUP_SKIP_SAME_STATUS and dup[1] == status:
+        print("DUPLICATE NOT STORED, same as", dup[0])
+        DUPLICATES.inc("skipped")
+        cur.close()
+        conn.close()
+        return None
+    if dup:
+        DUPLICATES.inc("flagged")
+
     cur.execute(
         f"""
         INSERT INTO {TABLE}
         (employee_id, work_order, charge_no, serial_no,
-         part_no, unique_no, status, time, image)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+         part_no, unique_no, status, time, image, phash, duplicate_of)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        RETURNING id, time
     """,
         (
             data["emp"],
@@ -166,21 +973,42 @@ def save_record(data, status, img_bytes):
             status,
             datetime.now(),
             psycopg2.Binary(img_bytes),
+            _signed64(phash),
+            dup[0] if dup else None,
         ),
     )
+    rid, t = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
+    DB_LATENCY.observe(perf_counter() - t0, "save")
+
+    CACHE.append(
+        rid,
+        t,
+        status,
+        (
+            data["emp"],
+            data["wo"],
+            data["charge"],
+            data["serial"],
+            data["part"],
+            data["unique"],
+        ),
+    )
+    return rid
 
 
 # ================= DB FETCH =================
-def fetch_report(from_dt, to_dt, status):
+def fetch_report(from_dt, to_dt, status, with_images=True):
+    t0 = perf_counter()
     conn = psycopg2.connect(**DB)
     cur = conn.cursor()
+    image_col = "image" if with_images else "NULL"
     q = f"""
         SELECT employee_id, work_order, charge_no,
                serial_no, part_no, unique_no,
-               image, status, time
+               {image_col}, status, time
         FROM {TABLE}
         WHERE time BETWEEN %s AND %s
     """
@@ -193,56 +1021,1013 @@ def fetch_report(from_dt, to_dt, status):
     rows = cur.fetchall()
     cur.close()
     conn.close()
+    DB_LATENCY.observe(perf_counter() - t0, "report")
+
+    # Older days may live in the archive instead of the table
+    archived = fetch_archive(from_dt, to_dt, status, with_images)
+    if archived:
+        rows += archived
+        rows.sort(key=lambda r: r[8], reverse=True)
+    return rows
+
+
+def fetch_images(ids):
+    conn = psycopg2.connect(**DB)
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, image FROM {TABLE} WHERE id = ANY(%s)", (list(ids),))
+    images = dict(cur.fetchall())
+    cur.close()
+    conn.close()
+    return images
+
+
+def query_report(from_dt, to_dt, status, with_images=True):
+    # Recent ranges come from the in-memory cache without images; their
+    # rows carry the id as r[9] so the images can be fetched by key later
+    rows = CACHE.query(from_dt, to_dt, status)
+    if rows is None:
+        return fetch_report(from_dt, to_dt, status, with_images)
     return rows
 
 
 def get_home_counts():
+    t0 = perf_counter()
     conn = psycopg2.connect(**DB)
     cur = conn.cursor()
 
-    # Total counts
+    # Read from the hourly rollup (covers archived rows too), not the raw table
+    today_start = datetime.combine(datetime.today().date(), time.min)
     cur.execute(
         f"""
         SELECT
-            COUNT(*) AS total,
-            COUNT(*) FILTER (WHERE status='OK') AS ok_count,
-            COUNT(*) FILTER (WHERE status='NOT_OK') AS not_ok_count
+            SUM(total),
+            SUM(ok_count),
+            SUM(not_ok_count),
+            SUM(total) FILTER (WHERE hour >= %s)
+        FROM {ROLLUP}
+    """,
+        (today_start,),
+    )
+    total, ok_cnt, not_ok_cnt, today_cnt = cur.fetchone()
+
+    cur.close()
+    conn.close()
+    DB_LATENCY.observe(perf_counter() - t0, "counts")
+
+    return (total or 0, ok_cnt or 0, not_ok_cnt or 0, today_cnt or 0)
+
+
+# ================= RECENT CACHE =================
+class InspectionCache:
+    # Metadata of the last CACHE_DAYS days as NumPy columns. Text columns
+    # are dictionary encoded (int32 codes + value list); no images.
+    def __init__(self, days=CACHE_DAYS, max_bytes=CACHE_MAX_BYTES):
+        self.days = days
+        self.max_bytes = max_bytes
+        self.start = None  # None = not warmed, every query misses
+        self.max_id = 0
+        self.synced = 0
+        self._alloc(1024)
+        self.n = 0
+        self.words = [[] for _ in CACHE_TEXT]
+        self.codes = [{} for _ in CACHE_TEXT]
+        self.word_bytes = 0
+
+    def _alloc(self, cap):
+        self.ids = np.zeros(cap, np.int64)
+        self.times = np.zeros(cap, "datetime64[us]")
+        self.status = np.zeros(cap, np.int8)
+        self.text = np.zeros((cap, len(CACHE_TEXT)), np.int32)
+
+    def nbytes(self):
+        arrays = (self.ids, self.times, self.status, self.text)
+        return sum(a.nbytes for a in arrays) + self.word_bytes
+
+    def _code(self, col, value):
+        value = value or ""
+        code = self.codes[col].get(value)
+        if code is None:
+            code = self.codes[col][value] = len(self.words[col])
+            self.words[col].append(value)
+            self.word_bytes += len(value) + 64
+        return code
+
+    def append(self, rid, t, status, text):
+        # max_id only moves in _sync: a local save must not hide rows of
+        # other stations that have lower ids and are not synced yet
+        if self.start is None:
+            return
+        if self.n == len(self.ids):
+            self._grow()
+        i = self.n
+        self.ids[i] = rid
+        self.times[i] = t
+        self.status[i] = STATUS_CODES.get(status, 0)
+        self.text[i] = [self._code(c, v) for c, v in enumerate(text)]
+        self.n += 1
+
+    def _grow(self):
+        # Drop rows that left the window, then double (or shrink the window
+        # when the memory budget is hit). The window starts at midnight so
+        # the default report range (whole days) keeps hitting the cache.
+        self._evict(
+            datetime.combine(
+                datetime.today().date() - timedelta(days=self.days), time.min
+            )
+        )
+        if self.n < len(self.ids) // 2:
+            return
+        if self.nbytes() * 2 > self.max_bytes:
+            mid = self.times[self.n // 2].item()
+            print("CACHE FULL → dropping rows before", mid)
+            self._evict(mid)
+            if self.n == len(self.ids):
+                # Older half shares one timestamp; drop it as well
+                self._evict(mid + timedelta(microseconds=1))
+            if self.n < len(self.ids):
+                return
+        old = (self.ids, self.times, self.status, self.text)
+        self._alloc(len(self.ids) * 2)
+        for dst, src in zip((self.ids, self.times, self.status, self.text), old):
+            dst[: self.n] = src[: self.n]
+
+    def _evict(self, before):
+        before = max(before, self.start)
+        keep = self.times[: self.n] >= np.datetime64(before, "us")
+        n = int(np.count_nonzero(keep))
+        for a in (self.ids, self.times, self.status, self.text):
+            a[:n] = a[: self.n][keep]
+        self.n = n
+        self.start = before
+
+        # Rebuild the dictionaries from the rows kept; serial/unique numbers
+        # are nearly one value per row and would otherwise never be freed
+        self.word_bytes = 0
+        for c in range(len(CACHE_TEXT)):
+            used, self.text[:n, c] = np.unique(self.text[:n, c], return_inverse=True)
+            self.words[c] = [self.words[c][u] for u in used.tolist()]
+            self.codes[c] = {w: i for i, w in enumerate(self.words[c])}
+            self.word_bytes += sum(len(w) + 64 for w in self.words[c])
+
+    def warm(self):
+        self.start = datetime.combine(
+            datetime.today().date() - timedelta(days=self.days), time.min
+        )
+        self.n = self.max_id = 0
+        self._sync(force=True)
+        print(f"CACHE WARM: {self.n} rows since {self.start}, {self.nbytes()} bytes")
+
+    def _sync(self, force=False):
+        if not force and monotonic() - self.synced < CACHE_SYNC_SEC:
+            return
+        self.synced = monotonic()
+
+        conn = psycopg2.connect(**DB)
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT id, time, status, {", ".join(CACHE_TEXT)}
+            FROM {TABLE}
+            WHERE id > %s AND time >= %s
+            ORDER BY id
+        """,
+            (self.max_id - CACHE_SYNC_BACK_IDS, self.start),
+        )
+        floor = self.max_id - CACHE_SYNC_BACK_IDS
+        ids = self.ids[: self.n]
+        have = set(ids[ids > floor].tolist())
+        for rid, t, status, *text in cur:
+            if rid not in have:
+                self.append(rid, t, status, text)
+            self.max_id = max(self.max_id, rid)
+        cur.close()
+        conn.close()
+
+    def _mask(self, from_dt, to_dt, status):
+        if self.start is None or from_dt < self.start:
+            return None
+        self._sync()
+        times = self.times[: self.n]
+        mask = (times >= np.datetime64(from_dt, "us")) & (
+            times <= np.datetime64(to_dt, "us")
+        )
+        if status != "ALL":
+            mask &= self.status[: self.n] == STATUS_CODES.get(status, 0)
+        return mask
+
+    def count(self, from_dt, to_dt, status="ALL"):
+        mask = self._mask(from_dt, to_dt, status)
+        return None if mask is None else int(np.count_nonzero(mask))
+
+    def query(self, from_dt, to_dt, status):
+        # Same row shape as fetch_report (image = None) + id, newest first
+        mask = self._mask(from_dt, to_dt, status)
+        if mask is None:
+            return None
+
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(self.times[idx], kind="stable")[::-1]]
+        names = {v: k for k, v in STATUS_CODES.items()}
+        text = [
+            [self.words[c][code] for code in self.text[idx, c].tolist()]
+            for c in range(len(CACHE_TEXT))
+        ]
+        return [
+            (*cols[:6], None, names.get(st, ""), t, rid)
+            for cols, st, t, rid in zip(
+                zip(*text),
+                self.status[idx].tolist(),
+                self.times[idx].tolist(),
+                self.ids[idx].tolist(),
+            )
+        ]
+
+
+CACHE = InspectionCache()
+
+
+# ================= ANALYTICS =================
+# {ROLLUP} holds one row per (hour, work order, employee). A statement-level
+# insert trigger folds new rows in, so reads never touch the raw table and
+# archiving raw rows does not change the rollup.
+def init_rollups(cur):
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP} (
+            hour TIMESTAMP NOT NULL,
+            work_order TEXT NOT NULL,
+            employee_id TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            ok_count INTEGER NOT NULL DEFAULT 0,
+            not_ok_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, work_order, employee_id)
+        )
+    """
+    )
+    cur.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION {ROLLUP}_fn() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {ROLLUP} AS r
+                (hour, work_order, employee_id, total, ok_count, not_ok_count)
+            SELECT date_trunc('hour', time),
+                   COALESCE(work_order, ''),
+                   COALESCE(employee_id, ''),
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE status = 'OK'),
+                   COUNT(*) FILTER (WHERE status = 'NOT_OK')
+            FROM new_rows
+            WHERE time IS NOT NULL
+            GROUP BY 1, 2, 3
+            ON CONFLICT (hour, work_order, employee_id) DO UPDATE SET
+                total = r.total + EXCLUDED.total,
+                ok_count = r.ok_count + EXCLUDED.ok_count,
+                not_ok_count = r.not_ok_count + EXCLUDED.not_ok_count;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """
+    )
+    # CREATE TRIGGER locks the table exclusively; only do it once
+    cur.execute(
+        "SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass",
+        (f"{ROLLUP}_trg", TABLE),
+    )
+    if cur.fetchone():
+        return
+    cur.execute(
+        f"""
+        CREATE TRIGGER {ROLLUP}_trg
+        AFTER INSERT ON {TABLE}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {ROLLUP}_fn()
+    """
+    )
+
+
+def rebuild_rollups(cur):
+    # Full rebuild from the live table plus every archive segment
+    cur.execute(f"LOCK TABLE {TABLE} IN SHARE MODE")
+    cur.execute(f"TRUNCATE {ROLLUP}")
+    cur.execute(
+        f"""
+        INSERT INTO {ROLLUP}
+            (hour, work_order, employee_id, total, ok_count, not_ok_count)
+        SELECT date_trunc('hour', time),
+               COALESCE(work_order, ''),
+               COALESCE(employee_id, ''),
+               COUNT(*),
+               COUNT(*) FILTER (WHERE status = 'OK'),
+               COUNT(*) FILTER (WHERE status = 'NOT_OK')
         FROM {TABLE}
+        WHERE time IS NOT NULL
+        GROUP BY 1, 2, 3
     """
     )
-    total, ok_cnt, not_ok_cnt = cur.fetchone()
 
-    # Today count
-    today_start = datetime.combine(datetime.today().date(), time.min)
-    today_end = datetime.combine(datetime.today().date(), time.max)
+    for _, base in _archive_segments():
+        agg = {}
+        for m in _read_segment_meta(base):
+            hour = datetime.fromisoformat(m["time"]).replace(
+                minute=0, second=0, microsecond=0
+            )
+            c = agg.setdefault((hour, m["work_order"], m["employee_id"]), [0, 0, 0])
+            c[0] += 1
+            c[1] += m["status"] == "OK"
+            c[2] += m["status"] == "NOT_OK"
+        for (hour, wo, emp), (t, o, n) in agg.items():
+            cur.execute(
+                f"""
+                INSERT INTO {ROLLUP} AS r
+                    (hour, work_order, employee_id, total, ok_count, not_ok_count)
+                VALUES (%s,%s,%s,%s,%s,%s)
+                ON CONFLICT (hour, work_order, employee_id) DO UPDATE SET
+                    total = r.total + EXCLUDED.total,
+                    ok_count = r.ok_count + EXCLUDED.ok_count,
+                    not_ok_count = r.not_ok_count + EXCLUDED.not_ok_count
+            """,
+                (hour, wo, emp, t, o, n),
+            )
+
+
+def _shift_sql():
+    parts = []
+    for name, start, end in SHIFTS:
+        h = "EXTRACT(HOUR FROM hour)"
+        if start < end:
+            parts.append(f"WHEN {h} >= {start} AND {h} < {end} THEN '{name}'")
+        else:
+            parts.append(f"WHEN {h} >= {start} OR {h} < {end} THEN '{name}'")
+    return "CASE " + " ".join(parts) + " ELSE '-' END"
 
+
+YIELD_GROUPS = {
+    "Work Order": "work_order",
+    "Employee": "employee_id",
+    "Shift": _shift_sql(),
+    "Day": "hour::date",
+    "Hour": "hour",
+}
+
+
+def fetch_yield(from_dt, to_dt, by="Work Order"):
+    # Rows of (key, total, ok, not_ok, not_ok_rate), most inspected first
+    t0 = perf_counter()
+    key = YIELD_GROUPS[by]
+    conn = psycopg2.connect(**DB)
+    cur = conn.cursor()
     cur.execute(
         f"""
-        SELECT COUNT(*)
+        SELECT {key} AS k,
+               SUM(total), SUM(ok_count), SUM(not_ok_count),
+               SUM(not_ok_count)::float / NULLIF(SUM(total), 0)
+        FROM {ROLLUP}
+        WHERE hour BETWEEN %s AND %s
+        GROUP BY k
+        ORDER BY {"k" if by in ("Day", "Hour") else "2 DESC"}
+    """,
+        (from_dt, to_dt),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    DB_LATENCY.observe(perf_counter() - t0, "yield")
+    return rows
+
+
+# ================= ARCHIVE =================
+# One segment per archived day (plus a suffix with the first row id):
+#   <day>_<id>.pack         raw JPEG bytes back to back
+#   <day>_<id>.meta.csv.gz  row metadata + offset/length into the pack file
+# The .pack file is written first, so a segment only "exists" once its meta
+# file is in place.
+
+
+def _archive_segments(from_day=None, to_day=None):
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+
+    segs = []
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        if not name.endswith(".meta.csv.gz"):
+            continue
+        base = name[: -len(".meta.csv.gz")]
+        day = datetime.strptime(base.split("_")[0], "%Y-%m-%d").date()
+        if from_day and day < from_day:
+            continue
+        if to_day and day > to_day:
+            continue
+        segs.append((day, os.path.join(ARCHIVE_DIR, base)))
+    return segs
+
+
+def _read_segment_meta(base):
+    with gzip.open(base + ".meta.csv.gz", "rt", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def _archive_day(conn, day):
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+
+    # Rows already in a segment (crash between file write and DELETE)
+    done = set()
+    for _, base in _archive_segments(day, day):
+        done.update(int(m["id"]) for m in _read_segment_meta(base))
+
+    # Server-side cursor: never hold a whole day of images in memory
+    cur = conn.cursor(name=f"archive_{day:%Y%m%d}")
+    cur.itersize = 200
+    cur.execute(
+        f"""
+        SELECT id, employee_id, work_order, charge_no, serial_no,
+               part_no, unique_no, status, time, phash, duplicate_of, image
         FROM {TABLE}
-        WHERE time BETWEEN %s AND %s
+        WHERE time >= %s AND time < %s
+        ORDER BY id
     """,
-        (today_start, today_end),
+        (start, end),
     )
-    today_cnt = cur.fetchone()[0]
 
+    ids = []
+    base = pack = meta = writer = None
+    offset = 0
+    for row in cur:
+        ids.append(row[0])
+        if row[0] in done:
+            continue
+
+        if pack is None:
+            base = os.path.join(ARCHIVE_DIR, f"{day:%Y-%m-%d}_{row[0]}")
+            pack = open(base + ".pack.tmp", "wb")
+            meta = gzip.open(base + ".meta.csv.gz.tmp", "wt", newline="")
+            writer = csv.writer(meta)
+            writer.writerow(ARCHIVE_FIELDS)
+
+        img = bytes(row[11]) if row[11] is not None else b""
+        pack.write(img)
+        writer.writerow([*row[:8], row[8].isoformat(), *row[9:11], offset, len(img)])
+        offset += len(img)
+    cur.close()
+
+    if pack is not None:
+        pack.flush()
+        os.fsync(pack.fileno())
+        pack.close()
+        meta.close()
+        os.replace(base + ".pack.tmp", base + ".pack")
+        os.replace(base + ".meta.csv.gz.tmp", base + ".meta.csv.gz")
+
+    if ids:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM {TABLE} WHERE id = ANY(%s)", (ids,))
+        cur.close()
+    conn.commit()
+    return len(ids)
+
+
+def archive_old_inspections(days=ARCHIVE_AFTER_DAYS):
+    cutoff = datetime.today().date() - timedelta(days=days)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    conn = psycopg2.connect(**DB)
+    cur = conn.cursor()
+    cur.execute(f"SELECT MIN(time) FROM {TABLE}")
+    oldest = cur.fetchone()[0]
     cur.close()
+    conn.commit()
+
+    archived = 0
+    day = oldest.date() if oldest else cutoff
+    while day < cutoff:
+        n = _archive_day(conn, day)
+        if n:
+            print("ARCHIVED", day, n)
+        archived += n
+        day += timedelta(days=1)
+
+    # Let the freed pages be reused right away
+    if archived:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"VACUUM ANALYZE {TABLE}")
+        cur.close()
     conn.close()
+    return archived
+
+
+def iter_archive(from_dt, to_dt, status, with_images=True, work_order=None):
+    # Rows shaped like fetch_report's, plus the original id as r[9].
+    # from_dt/to_dt may be None for an open range.
+    from_day = from_dt.date() if from_dt else None
+    to_day = to_dt.date() if to_dt else None
+    for _, base in _archive_segments(from_day, to_day):
+        with open(base + ".pack", "rb") as f:
+            # mmap of an empty file fails (segment of image-less rows)
+            mm = None
+            if with_images and os.fstat(f.fileno()).st_size:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            for m in _read_segment_meta(base):
+                t = datetime.fromisoformat(m["time"])
+                if (from_dt and t < from_dt) or (to_dt and t > to_dt):
+                    continue
+                if status != "ALL" and m["status"] != status:
+                    continue
+                if work_order and m["work_order"] != work_order:
+                    continue
+
+                off, ln = int(m["offset"]), int(m["length"])
+                img = mm[off : off + ln] if mm else (b"" if with_images else None)
+                yield (
+                    m["employee_id"],
+                    m["work_order"],
+                    m["charge_no"],
+                    m["serial_no"],
+                    m["part_no"],
+                    m["unique_no"],
+                    img,
+                    m["status"],
+                    t,
+                    int(m["id"]),
+                )
+
+            if mm:
+                mm.close()
+
+
+def fetch_archive(from_dt, to_dt, status, with_images=True):
+    return list(iter_archive(from_dt, to_dt, status, with_images))
+
+
+# ================= EXPORT =================
+EXPORT_HEADER = [
+    "Employee ID",
+    "Work Order",
+    "Charge No",
+    "Serial No",
+    "Part No",
+    "Unique No",
+    "Status",
+    "Date",
+    "Time",
+]
+
+
+def _export_row(r):
+    return [
+        r[0],
+        r[1],
+        r[2],
+        r[3],
+        r[4],
+        r[5],
+        r[7],
+        r[8].strftime("%Y-%m-%d"),
+        r[8].strftime("%H:%M:%S"),
+    ]
+
+
+def write_excel(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(EXPORT_HEADER)
+
+    green = PatternFill("solid", fgColor="C6EFCE")
+    red = PatternFill("solid", fgColor="FFC7CE")
+
+    for r in rows:
+        ws.append(_export_row(r))
+        ws[f"G{ws.max_row}"].fill = green if r[7] == "OK" else red
+
+    wb.save(path)
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(EXPORT_HEADER)
+        for r in rows:
+            w.writerow(_export_row(r))
 
-    return (total or 0, ok_cnt or 0, not_ok_cnt or 0, today_cnt or 0)
+
+# ================= RE-INSPECTION =================
+# Evaluators take (jpeg bytes, meta dict) and return (status, score, detail).
+# Besides the names below, "package.module:function" is accepted.
+_ocr_reader = None
+
+
+def evaluate_sharpness(img, meta):
+    g = cv2.imdecode(np.frombuffer(img, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if g is None:
+        return "ERROR", None, "not a JPEG"
+    score = float(cv2.Laplacian(g, cv2.CV_64F).var())
+    return ("OK" if score >= SHARPNESS_MIN else "NOT_OK"), score, ""
+
+
+def evaluate_ocr(img, meta):
+    # Part must show its unique no; easyocr is only loaded when used
+    global _ocr_reader
+    if _ocr_reader is None:
+        import easyocr
+
+        _ocr_reader = easyocr.Reader(["en"], gpu=False)
+    text = "".join(_ocr_reader.readtext(img, detail=0)).replace(" ", "").upper()
+    found = bool(meta["unique"]) and meta["unique"].upper() in text
+    return ("OK" if found else "NOT_OK"), float(found), text[:200]
+
+
+EVALUATORS = {
+    "sharpness": evaluate_sharpness,
+    "ocr": evaluate_ocr,
+}
+
+
+def _resolve_evaluator(name):
+    if name in EVALUATORS:
+        return EVALUATORS[name]
+    module, _, func = name.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+
+_evaluator = None
+
+
+def _reinspect_init(name):
+    global _evaluator
+    _evaluator = _resolve_evaluator(name)
+
+
+def _reinspect_batch(rows):
+    # Runs in a pool worker
+    out = []
+    for rid, unique, charge, img in rows:
+        try:
+            status, score, detail = _evaluator(img, dict(unique=unique, charge=charge))
+        except Exception as e:
+            status, score, detail = "ERROR", None, repr(e)
+        out.append((rid, status, score, detail))
+    return out
+
+
+def init_reinspection(cur):
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {REINSPECT_TABLE} (
+            run TEXT NOT NULL,
+            inspection_id INTEGER NOT NULL,
+            status TEXT,
+            score DOUBLE PRECISION,
+            detail TEXT,
+            time TIMESTAMP,
+            PRIMARY KEY (run, inspection_id)
+        )
+    """
+    )
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {REINSPECT_RUNS} (
+            run TEXT PRIMARY KEY,
+            evaluator TEXT,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            started TIMESTAMP,
+            updated TIMESTAMP,
+            archive_last_id INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    cur.execute(
+        f"""
+        ALTER TABLE {REINSPECT_RUNS}
+        ADD COLUMN IF NOT EXISTS archive_last_id INTEGER NOT NULL DEFAULT 0
+    """
+    )
+
+
+def reinspect(
+    run, evaluator, from_dt=None, to_dt=None, workers=None, batch=REINSPECT_BATCH
+):
+    _resolve_evaluator(evaluator)  # fail fast on a bad name
+
+    # Results and checkpoint are committed together, so a restarted run
+    # continues after the last batch that was written
+    wconn = psycopg2.connect(**DB)
+    wcur = wconn.cursor()
+    init_reinspection(wcur)
+    wcur.execute(
+        f"""
+        INSERT INTO {REINSPECT_RUNS} (run, evaluator, started, updated)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (run) DO NOTHING
+    """,
+        (run, evaluator, datetime.now(), datetime.now()),
+    )
+    wcur.execute(
+        f"""
+        SELECT evaluator, last_id, archive_last_id, processed
+        FROM {REINSPECT_RUNS} WHERE run=%s
+    """,
+        (run,),
+    )
+    run_eval, last_id, archive_last_id, processed = wcur.fetchone()
+    wconn.commit()
+    if run_eval != evaluator:
+        raise ValueError(f"run {run!r} was started with evaluator {run_eval!r}")
+    if last_id or archive_last_id:
+        print(
+            f"RESUMING {run} after id {last_id}, archive id {archive_last_id} "
+            f"({processed} done)"
+        )
+
+    # Archived days first (their own checkpoint, ids grow with time inside
+    # the archive), then the live table
+    archived = (
+        (r[9], r[5], r[2], r[6])
+        for r in iter_archive(from_dt, to_dt, "ALL")
+        if r[9] > archive_last_id
+    )
+
+    q = f"SELECT id, unique_no, charge_no, image FROM {TABLE} WHERE id > %s"
+    params = [last_id]
+    if from_dt:
+        q += " AND time >= %s"
+        params.append(from_dt)
+    if to_dt:
+        q += " AND time <= %s"
+        params.append(to_dt)
+    q += " ORDER BY id"
+
+    rconn = psycopg2.connect(**DB)
+    rcur = rconn.cursor(name=f"reinspect_{os.getpid()}")  # server-side cursor
+    rcur.itersize = batch * 4
+    rcur.execute(q, params)
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers, initializer=_reinspect_init, initargs=(evaluator,)
+    )
+    max_pending = (workers or os.cpu_count() or 1) * 2
+    pending = []  # (checkpoint column, future) in id order; oldest is written
+    t0 = perf_counter()
+    done = 0
+
+    def write_oldest():
+        nonlocal done, processed
+        column, fut = pending.pop(0)
+        results = fut.result()
+        now = datetime.now()
+        execute_values(
+            wcur,
+            f"""
+            INSERT INTO {REINSPECT_TABLE}
+                (run, inspection_id, status, score, detail, time)
+            VALUES %s
+            ON CONFLICT (run, inspection_id) DO UPDATE SET
+                status = EXCLUDED.status,
+                score = EXCLUDED.score,
+                detail = EXCLUDED.detail,
+                time = EXCLUDED.time
+        """,
+            [(run, rid, st, sc, dt, now) for rid, st, sc, dt in results],
+        )
+        done += len(results)
+        processed += len(results)
+        wcur.execute(
+            f"""
+            UPDATE {REINSPECT_RUNS}
+            SET {column}=%s, processed=%s, updated=%s
+            WHERE run=%s
+        """,
+            (results[-1][0], processed, now, run),
+        )
+        wconn.commit()
+
+        rate = done / (perf_counter() - t0)
+        print(f"{run}: {processed} images, last id {results[-1][0]}, {rate:.1f} img/s")
+
+    def submit(column, rows):
+        pending.append((column, pool.submit(_reinspect_batch, rows)))
+        if len(pending) >= max_pending:
+            write_oldest()
+
+    try:
+        while True:
+            rows = list(itertools.islice(archived, batch))
+            if not rows:
+                break
+            submit("archive_last_id", rows)
+        while True:
+            rows = rcur.fetchmany(batch)
+            if not rows:
+                break
+            rows = [(rid, u, c, bytes(img or b"")) for rid, u, c, img in rows]
+            submit("last_id", rows)
+        while pending:
+            write_oldest()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        rcur.close()
+        rconn.close()
+        wcur.close()
+        wconn.close()
+
+    secs = perf_counter() - t0
+    rate = done / max(secs, 1e-9)
+    print(f"REINSPECTED {done} images in {secs:.1f}s ({rate:.1f} img/s)")
+    return done
+
+
+# ================= EVIDENCE EXPORT =================
+EVIDENCE_FIELDS = [
+    "file",
+    "id",
+    "employee_id",
+    "work_order",
+    "charge_no",
+    "serial_no",
+    "part_no",
+    "unique_no",
+    "status",
+    "time",
+    "size",
+    "sha256",
+]
+
+
+def _evidence_where(from_dt, to_dt, work_order, status):
+    q, params = [], []
+    if from_dt:
+        q.append("time >= %s")
+        params.append(from_dt)
+    if to_dt:
+        q.append("time <= %s")
+        params.append(to_dt)
+    if work_order:
+        q.append("work_order = %s")
+        params.append(work_order)
+    if status != "ALL":
+        q.append("status = %s")
+        params.append(status)
+    return (" WHERE " + " AND ".join(q)) if q else "", params
+
+
+def _put(q, item, cancel):
+    # Blocking put that gives up once the export is cancelled
+    while not cancel.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _safe_name(s):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(s or ""))
+
+
+def export_evidence(
+    path,
+    from_dt=None,
+    to_dt=None,
+    work_order=None,
+    status="ALL",
+    progress=None,
+    cancel=None,
+):
+    # Images + manifest.csv/json in one ZIP. A fetch thread streams chunks
+    # from a server-side cursor (then the archive) into a bounded queue
+    # while this thread writes them, so memory stays at a few chunks.
+    cancel = cancel or threading.Event()
+    where, params = _evidence_where(from_dt, to_dt, work_order, status)
+
+    conn = psycopg2.connect(**DB)
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {TABLE}{where}", params)
+    total = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    total += sum(1 for _ in iter_archive(from_dt, to_dt, status, False, work_order))
+
+    chunks = queue.Queue(maxsize=EVIDENCE_QUEUE)
+
+    def fetch():
+        conn = psycopg2.connect(**DB)
+        try:
+            cur = conn.cursor(name=f"evidence_{threading.get_ident()}")
+            cur.itersize = EVIDENCE_CHUNK
+            cur.execute(
+                f"""
+                SELECT employee_id, work_order, charge_no, serial_no,
+                       part_no, unique_no, image, status, time, id
+                FROM {TABLE}{where}
+                ORDER BY time
+            """,
+                params,
+            )
+            while not cancel.is_set():
+                rows = cur.fetchmany(EVIDENCE_CHUNK)
+                if not rows:
+                    break
+                rows = [(*r[:6], bytes(r[6] or b""), *r[7:]) for r in rows]
+                if not _put(chunks, rows, cancel):
+                    return
+            cur.close()
+
+            rows = []
+            for r in iter_archive(from_dt, to_dt, status, True, work_order):
+                rows.append(r)
+                if len(rows) == EVIDENCE_CHUNK:
+                    if not _put(chunks, rows, cancel):
+                        return
+                    rows = []
+            if rows:
+                _put(chunks, rows, cancel)
+        except Exception as e:
+            _put(chunks, e, cancel)
+        finally:
+            conn.close()
+            # The end marker must arrive even after a cancel; if the queue
+            # is full the writer is not reading and checks cancel itself
+            if not _put(chunks, None, cancel):
+                try:
+                    chunks.put_nowait(None)
+                except queue.Full:
+                    pass
+
+    threading.Thread(target=fetch, daemon=True, name="evidence-fetch").start()
+
+    tmp = path + ".part"
+    manifest = []
+    done = 0
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            while not cancel.is_set():
+                try:
+                    item = chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                for r in item:
+                    t = r[8]
+                    name = (
+                        f"images/{t:%Y%m%d_%H%M%S}_{_safe_name(r[1])}"
+                        f"_{_safe_name(r[5])}_{r[9]}.jpg"
+                    )
+                    info = zipfile.ZipInfo(name, date_time=t.timetuple()[:6])
+                    # JPEG is already compressed; store it as is
+                    zf.writestr(info, r[6], compress_type=zipfile.ZIP_STORED)
+                    manifest.append(
+                        [name, r[9], *r[:6], r[7], t.isoformat(), len(r[6])]
+                        + [hashlib.sha256(r[6]).hexdigest()]
+                    )
+
+                done += len(item)
+                if progress:
+                    progress(done, total)
+
+            if not cancel.is_set():
+                buf = io.StringIO()
+                w = csv.writer(buf)
+                w.writerow(EVIDENCE_FIELDS)
+                w.writerows(manifest)
+                zf.writestr("manifest.csv", buf.getvalue())
+                zf.writestr(
+                    "manifest.json",
+                    json.dumps([dict(zip(EVIDENCE_FIELDS, m)) for m in manifest]),
+                )
+    except BaseException:
+        cancel.set()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    if cancel.is_set():
+        os.remove(tmp)
+        return None
+    os.replace(tmp, path)
+    return done
 
 
 # ================= CONFIRM DIALOG =================
 class ConfirmDialog(QDialog):
     decision = Signal(str)
 
-    def __init__(self, pix):
+    def __init__(self, pix, note=""):
         super().__init__()
         self.setWindowTitle("Confirm Capture")
 
         img = QLabel(alignment=Qt.AlignCenter)
         img.setPixmap(pix.scaled(520, 360, Qt.KeepAspectRatio))
 
+        warn = QLabel(note, alignment=Qt.AlignCenter)
+        warn.setStyleSheet("background:#ffc107;color:black;padding:8px;font-size:14px;")
+        warn.setVisible(bool(note))
+
         ok = QPushButton("OK")
         nok = QPushButton("NOT OK")
 
@@ -253,6 +2038,7 @@ class ConfirmDialog(QDialog):
         nok.clicked.connect(lambda: self.finish("NOT_OK"))
 
         lay = QVBoxLayout(self)
+        lay.addWidget(warn)
         lay.addWidget(img)
         btns = QHBoxLayout()
         btns.addWidget(ok)
@@ -299,7 +2085,26 @@ class Home(QWidget):
         self.nok_lbl = self._card("NOT OK COUNT", "#c62828")
         self.today_lbl = self._card("TODAY INSPECTIONS", "#6a1b9a")
 
-        self.main.addStretch()
+        # ---- Yield (from rollups only) ----
+        yhead = QHBoxLayout()
+        ytitle = QLabel(f"Yield (last {YIELD_DAYS} days) by")
+        ytitle.setStyleSheet("font-size:16px;font-weight:bold;")
+        self.yield_by = QComboBox()
+        self.yield_by.addItems(list(YIELD_GROUPS))
+        self.yield_by.currentIndexChanged.connect(self.load_yield)
+        yhead.addWidget(ytitle)
+        yhead.addWidget(self.yield_by)
+        yhead.addStretch()
+        self.main.addLayout(yhead)
+
+        self.yield_table = QTableWidget(0, 5)
+        self.yield_table.setHorizontalHeaderLabels(
+            ["Group", "Total", "OK", "NOT OK", "NOT OK %"]
+        )
+        self.yield_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.yield_table.verticalHeader().setVisible(False)
+        self.yield_table.setStyleSheet("background:white;")
+        self.main.addWidget(self.yield_table)
 
         self.refresh()  # initial load
 
@@ -323,10 +2128,33 @@ class Home(QWidget):
 
     def refresh(self):
         total, ok_cnt, not_ok_cnt, today_cnt = get_home_counts()
+        today_start = datetime.combine(datetime.today().date(), time.min)
+        cached = CACHE.count(today_start, datetime.now())
+        if cached is not None:
+            today_cnt = cached
         self.total_lbl.setText(str(total))
         self.ok_lbl.setText(str(ok_cnt))
         self.nok_lbl.setText(str(not_ok_cnt))
         self.today_lbl.setText(str(today_cnt))
+        self.load_yield()
+
+    def load_yield(self):
+        to_dt = datetime.now()
+        rows = fetch_yield(
+            to_dt - timedelta(days=YIELD_DAYS), to_dt, self.yield_by.currentText()
+        )
+
+        self.yield_table.setRowCount(0)
+        for key, total, ok_cnt, not_ok_cnt, rate in rows:
+            row = self.yield_table.rowCount()
+            self.yield_table.insertRow(row)
+            values = (key, total, ok_cnt, not_ok_cnt, f"{(rate or 0) * 100:.1f}")
+            for c, v in enumerate(values):
+                item = QTableWidgetItem(str(v))
+                item.setTextAlignment(Qt.AlignCenter)
+                self.yield_table.setItem(row, c, item)
+            if rate:
+                self.yield_table.item(row, 4).setForeground(QColor("red"))
 
     def showEvent(self, event):
         super().showEvent(event)
@@ -356,8 +2184,11 @@ class Operator(QWidget):
         """
         )
 
-        self.cap = None
+        self.acq = None
         self.frame = None
+        self._pending = None
+        self._pending_at = 0
+        self._fps_frames, self._fps_since = 0, monotonic()
 
         # ---- Top bar with refresh ----
         self.btn_refresh = QPushButton("🔄 New User")
@@ -468,6 +2299,7 @@ class Operator(QWidget):
 
     def on_socket_data(self, msg):
         print("Socket accepted:", msg)
+        TRIGGERS.inc("socket")
 
         charge = msg[0:14]
         unique = msg[14:21]
@@ -507,11 +2339,6 @@ class Operator(QWidget):
 
             self.start_camera()
 
-            if not hasattr(self, "socket_thread"):
-                self.socket_thread = FHVSocketThread()
-                self.socket_thread.data_received.connect(self.on_socket_data)
-                self.socket_thread.start()
-
 
 
     def validate_field(self, key):
@@ -527,35 +2354,41 @@ class Operator(QWidget):
 
     # ---------- CAMERA ----------
     def start_camera(self):
-        if self.cap is None:
-            self.cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-            if not self.cap.isOpened():
-                self.preview.setText("Camera not available")
-                return
+        # Camera and socket live in the acquisition worker process
+        if self.acq is None:
+            self.acq = AcquisitionProcess()
+            self.acq.socket_data.connect(self.on_socket_data)
+            self.acq.captured.connect(self._on_captured)
+            self.acq.status.connect(self.preview.setText)
+        self.acq.set_camera(True)
         self.timer.start(20)
 
     def stop_camera(self):
         self.timer.stop()
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        if self.acq:
+            self.acq.set_camera(False)
         self.preview.setText("Camera OFF")
 
     def update_frame(self):
-        if not self.cap:
+        if not self.acq:
             return
 
-        ret, frame = self.cap.read()
-        if not ret:
+        rgb = self.acq.latest_frame()
+        if rgb is None:
             return
 
-        self.frame = frame
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.frame = rgb
         h, w, ch = rgb.shape
         self.preview.setPixmap(
             QPixmap.fromImage(QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888))
         )
 
+        self._fps_frames += 1
+        now = monotonic()
+        if now - self._fps_since >= 1:
+            PREVIEW_FPS.set(self._fps_frames / (now - self._fps_since))
+            self._fps_frames, self._fps_since = 0, now
+
     # ---------- RESET ----------
     def reset_all(self):
         self.stop_camera()
@@ -566,6 +2399,7 @@ class Operator(QWidget):
         self.emp.show()
         self.wo.hide()
         self.socket_waiting = False
+        self._pending = None
 
 
         for lbl, le, _ in self.inputs.values():
@@ -589,15 +2423,20 @@ class Operator(QWidget):
 
     def on_enter(self):
         # Called when Operator page is shown
-        if hasattr(self, "socket_thread"):
+        if self.acq:
             print("Operator screen → resume socket")
-            self.socket_thread.resume()
+            self.acq.resume()
 
     def on_leave(self):
         # Called when Operator page is hidden
-        if hasattr(self, "socket_thread"):
+        if self.acq:
             print("Leaving Operator → pause socket")
-            self.socket_thread.pause()
+            self.acq.pause()
+
+    def shutdown(self):
+        if self.acq:
+            self.acq.stop()
+            self.acq = None
 
 
 
@@ -608,6 +2447,7 @@ class Operator(QWidget):
         if e.key() == Qt.Key_Return and self.frame is not None:
             if not self.all_fields_valid():
                 return
+            TRIGGERS.inc("key")
             self.capture()
 
 
@@ -619,11 +2459,14 @@ class Operator(QWidget):
 
 
     def capture(self):
-            _, buf = cv2.imencode(".jpg", self.frame)
-            img_bytes = buf.tobytes()
+            # JPEG encoding runs in the worker; the dialog opens in _on_captured
+            if self._pending is not None:
+                if monotonic() - self._pending_at < CAPTURE_TIMEOUT_SEC:
+                    return
+                print("❌ Capture timed out → retrying")
 
             #  CLEAN *EVERY* FIELD BEFORE DB
-            data = {
+            self._pending = {
                 "emp": clean_text(self.emp.text()),
                 "wo": clean_text(self.wo.text()),
                 "charge": clean_text(self.inputs["charge"][1].text()),
@@ -631,20 +2474,38 @@ class Operator(QWidget):
                 "part": clean_text(self.inputs["Vendor Code"][1].text()),
                 "unique": clean_text(self.inputs["unique"][1].text()),
             }
+            self._pending_at = monotonic()
+            self.acq.capture()
+
+    def _on_captured(self, img_bytes, phash):
+            data, self._pending = self._pending, None
+            if data is None or img_bytes is None:
+                print("❌ Camera frame not ready")
+                return
+            CAPTURES.inc()
+
+            note = ""
+            dup = find_duplicate(data, phash)
+            if dup:
+                note = f"Possible duplicate of #{dup[0]} ({dup[1]}, {dup[2]:%H:%M:%S})"
+                if DEDUP_SKIP_SAME_STATUS:
+                    note += f"\n{dup[1]} will not be stored again"
 
             pix = QPixmap.fromImage(QImage.fromData(img_bytes))
-            dlg = ConfirmDialog(pix)
+            dlg = ConfirmDialog(pix, note)
 
             def after_save(res):
-                save_record(data, res, img_bytes)
+                DECISIONS.inc(res)
+                rid = save_record(data, res, img_bytes, phash)
 
                 for _, le, _ in self.inputs.values():
                     le.clear()
 
-                if hasattr(self, "socket_thread"):
-                    self.socket_thread.resume()
+                if self.acq:
+                    self.acq.resume()
 
-                self.record_saved.emit()
+                if rid is not None:
+                    self.record_saved.emit()
 
             dlg.decision.connect(after_save)
             dlg.exec()
@@ -677,8 +2538,16 @@ class Report(QWidget):
         self.btn_excel.setStyleSheet(
             "background:#28a745;color:white;font-weight:bold;padding:6px 18px;"
         )
+        self.evidence_wo = QLineEdit(placeholderText="Work Order (optional)")
+        self.evidence_wo.setFixedWidth(180)
+        self.btn_evidence = QPushButton("Export Evidence ZIP")
+        self.btn_evidence.setStyleSheet(
+            "background:#1e88e5;color:white;font-weight:bold;padding:6px 18px;"
+        )
         right.addStretch()
         right.addWidget(self.btn_excel)
+        right.addWidget(self.evidence_wo)
+        right.addWidget(self.btn_evidence)
 
         header.addLayout(left)
         header.addStretch()
@@ -708,6 +2577,7 @@ class Report(QWidget):
         self.to_dt.dateChanged.connect(self.load)
         self.status.currentIndexChanged.connect(self.load)
         self.btn_excel.clicked.connect(self.export_excel)
+        self.btn_evidence.clicked.connect(self.export_evidence)
 
         self.load()
 
@@ -716,7 +2586,8 @@ class Report(QWidget):
 
         f = datetime.combine(self.from_dt.date().toPython(), time.min)
         t = datetime.combine(self.to_dt.date().toPython(), time.max)
-        rows = fetch_report(f, t, self.status.currentText())
+        rows = query_report(f, t, self.status.currentText())
+        missing = {}  # row -> id, for rows that came without their image
 
         for r in rows:
             row = self.table.rowCount()
@@ -755,9 +2626,23 @@ class Report(QWidget):
                                                                 """
             )
 
+            if r[6] is None and len(r) > 9:
+                missing[row] = r[9]
+                continue
+
             # Load image asynchronously after small delay
             QTimer.singleShot(10, lambda row=row, img=r[6]: self._set_image(row, img))
 
+        if missing:
+            # One primary-key lookup for all images of cached rows
+            QTimer.singleShot(10, lambda: self._load_images(missing))
+
+    def _load_images(self, missing):
+        images = fetch_images(missing.values())
+        for row, rid in missing.items():
+            if images.get(rid) is not None:
+                self._set_image(row, images[rid])
+
     def _set_image(self, row, img_bytes):
         pix = QPixmap()
         pix.loadFromData(bytes(img_bytes))
@@ -770,48 +2655,57 @@ class Report(QWidget):
         if not path:
             return
 
-        wb = Workbook()
-        ws = wb.active
-        ws.append(
-            [
-                "Employee ID",
-                "Work Order",
-                "Charge No",
-                "Serial No",
-                "Part No",
-                "Unique No",
-                "Status",
-                "Date",
-                "Time",
-            ]
+        rows = query_report(
+            datetime.combine(self.from_dt.date().toPython(), time.min),
+            datetime.combine(self.to_dt.date().toPython(), time.max),
+            self.status.currentText(),
+            with_images=False,
         )
+        write_excel(path, rows)
 
-        green = PatternFill("solid", fgColor="C6EFCE")
-        red = PatternFill("solid", fgColor="FFC7CE")
+    def export_evidence(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Evidence", "", "ZIP (*.zip)")
+        if not path:
+            return
 
-        rows = fetch_report(
+        wo = clean_text(self.evidence_wo.text()) or None
+        job = EvidenceJob(
+            path,
             datetime.combine(self.from_dt.date().toPython(), time.min),
             datetime.combine(self.to_dt.date().toPython(), time.max),
+            wo,
             self.status.currentText(),
         )
+        dlg = QProgressDialog("Exporting images…", "Cancel", 0, 0, self)
+        dlg.setWindowTitle("Evidence Export")
+        dlg.setWindowModality(Qt.WindowModal)
+        dlg.canceled.connect(job.cancel.set)
+        job.progress.connect(lambda n, total: (dlg.setMaximum(total), dlg.setValue(n)))
+        job.finished_with.connect(lambda msg: (dlg.reset(), print("EVIDENCE:", msg)))
+        self._evidence_job = job  # keep the thread alive
+        job.start()
+        dlg.show()
+
+
+class EvidenceJob(QThread):
+    # Runs export_evidence off the GUI thread
+    progress = Signal(int, int)
+    finished_with = Signal(str)
+
+    def __init__(self, path, from_dt, to_dt, work_order, status):
+        super().__init__()
+        self.args = (path, from_dt, to_dt, work_order, status)
+        self.cancel = threading.Event()
 
-        for r in rows:
-            ws.append(
-                [
-                    r[0],
-                    r[1],
-                    r[2],
-                    r[3],
-                    r[4],
-                    r[5],
-                    r[7],
-                    r[8].strftime("%Y-%m-%d"),
-                    r[8].strftime("%H:%M:%S"),
-                ]
+    def run(self):
+        try:
+            n = export_evidence(
+                *self.args, progress=self.progress.emit, cancel=self.cancel
             )
-            ws[f"G{ws.max_row}"].fill = green if r[7] == "OK" else red
-
-        wb.save(path)
+            msg = "cancelled" if n is None else f"{n} images → {self.args[0]}"
+        except Exception as e:
+            msg = f"failed: {e}"
+        self.finished_with.emit(msg)
 
 
 # ================= MAIN =================
@@ -863,6 +2757,10 @@ class Main(QWidget):
 
 
 
+    def closeEvent(self, event):
+        self.operator.shutdown()
+        super().closeEvent(event)
+
     def go_home(self):
             self.operator.on_leave()
             self.stack.setCurrentWidget(self.home)
@@ -878,10 +2776,216 @@ class Main(QWidget):
 
 
 
+# ================= CLI =================
+def _fetch_day(args):
+    # Runs in a pool worker: one day of report rows, without images
+    day, status = args
+    t0 = perf_counter()
+    rows = fetch_report(
+        datetime.combine(day, time.min),
+        datetime.combine(day, time.max),
+        status,
+        with_images=False,
+    )
+    return day, rows, perf_counter() - t0
+
+
+def export_report(from_day, to_day, status, fmt, path, workers=None):
+    t0 = perf_counter()
+
+    # Newest day first, same order as fetch_report (ORDER BY time DESC)
+    days = [to_day - timedelta(days=i) for i in range((to_day - from_day).days + 1)]
+    jobs = [(d, status) for d in days]
+
+    pool = None
+    if len(jobs) > 1 and workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+
+    rows = []
+    try:
+        results = pool.map(_fetch_day, jobs) if pool else map(_fetch_day, jobs)
+        for day, day_rows, secs in results:
+            print(f"{day}  {len(day_rows):>7} rows  {secs:6.2f}s")
+            rows += day_rows
+    finally:
+        if pool:
+            pool.shutdown()
+    t_fetch = perf_counter() - t0
+
+    if fmt == "csv":
+        write_csv(path, rows)
+    else:
+        write_excel(path, rows)
+    t_total = perf_counter() - t0
+
+    print(
+        f"EXPORTED {len(rows)} rows from {len(days)} days to {path} "
+        f"(fetch {t_fetch:.2f}s, write {t_total - t_fetch:.2f}s, total {t_total:.2f}s)"
+    )
+    return len(rows)
+
+
+def cli(argv):
+    p = argparse.ArgumentParser(prog="app.py")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    a = sub.add_parser("archive", help="move old inspections to the archive")
+    a.add_argument("days", nargs="?", type=int, default=ARCHIVE_AFTER_DAYS)
+
+    sub.add_parser("rollup", help="rebuild the yield rollup table")
+
+    ev = sub.add_parser("evidence", help="ZIP of images + manifest")
+    ev.add_argument("--from", dest="from_day", type=date.fromisoformat)
+    ev.add_argument("--to", dest="to_day", type=date.fromisoformat)
+    ev.add_argument("--work-order")
+    ev.add_argument("--status", choices=["ALL", "OK", "NOT_OK"], default="ALL")
+    ev.add_argument("--out", required=True)
+
+    r = sub.add_parser("reinspect", help="re-evaluate stored images (resumable)")
+    r.add_argument("--run", required=True, help="run name; reuse it to resume")
+    r.add_argument(
+        "--evaluator", default="sharpness", help="sharpness, ocr or module:function"
+    )
+    r.add_argument("--from", dest="from_day", type=date.fromisoformat)
+    r.add_argument("--to", dest="to_day", type=date.fromisoformat)
+    r.add_argument("--workers", type=int, default=None)
+    r.add_argument("--batch", type=int, default=REINSPECT_BATCH)
+
+    e = sub.add_parser("export", help="export a report without the GUI")
+    e.add_argument("--from", dest="from_day", type=date.fromisoformat, required=True)
+    e.add_argument("--to", dest="to_day", type=date.fromisoformat, default=date.today())
+    e.add_argument("--status", choices=["ALL", "OK", "NOT_OK"], default="ALL")
+    e.add_argument("--format", dest="fmt", choices=["xlsx", "csv"], default="xlsx")
+    e.add_argument("--out", required=True)
+    e.add_argument("--workers", type=int, default=None)
+
+    args = p.parse_args(argv)
+    if args.cmd == "archive":
+        print("ARCHIVED TOTAL:", archive_old_inspections(args.days))
+    elif args.cmd == "rollup":
+        conn = psycopg2.connect(**DB)
+        cur = conn.cursor()
+        rebuild_rollups(cur)
+        conn.commit()
+        cur.close()
+        conn.close()
+        print("ROLLUP REBUILT")
+    elif args.cmd == "evidence":
+        if not (args.from_day or args.to_day or args.work_order):
+            p.error("give --from/--to and/or --work-order")
+        t0 = perf_counter()
+        n = export_evidence(
+            args.out,
+            datetime.combine(args.from_day, time.min) if args.from_day else None,
+            datetime.combine(args.to_day, time.max) if args.to_day else None,
+            args.work_order,
+            args.status,
+            progress=lambda done, total: print(f"{done}/{total}", end="\r"),
+        )
+        print(f"EXPORTED {n} images to {args.out} in {perf_counter() - t0:.1f}s")
+    elif args.cmd == "reinspect":
+        reinspect(
+            args.run,
+            args.evaluator,
+            datetime.combine(args.from_day, time.min) if args.from_day else None,
+            datetime.combine(args.to_day, time.max) if args.to_day else None,
+            args.workers,
+            args.batch,
+        )
+    elif args.cmd == "export":
+        if args.from_day > args.to_day:
+            p.error("--from is after --to")
+        export_report(
+            args.from_day, args.to_day, args.status, args.fmt, args.out, args.workers
+        )
+    return 0
+
+
+# ================= STALL WATCHDOG =================
+class StallWatchdog(QObject):
+    # A GUI timer stamps a heartbeat. A background thread notices when it
+    # stops, samples the main thread's stack until it beats again and
+    # appends the stall (duration + most sampled functions) to STALL_LOG.
+    def __init__(self):
+        super().__init__()
+        self.main_id = threading.main_thread().ident
+        self.last_beat = monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._beat)
+        self.timer.start(HEARTBEAT_MS)
+
+        threading.Thread(target=self._watch, daemon=True, name="stall-watchdog").start()
+
+    def _beat(self):
+        self.last_beat = monotonic()
+
+    def _watch(self):
+        period = HEARTBEAT_MS / 1000
+        while True:
+            sleep(STALL_SAMPLE_MS / 1000)
+            beat = self.last_beat
+            if monotonic() - beat - period < STALL_MS / 1000:
+                continue
+
+            # Counts are kept as we go (a long stall must not pile up
+            # stacks); one sample is kept as the representative stack
+            top, app_top = {}, {}
+            samples, stack = 0, None
+            while self.last_beat == beat:
+                frame = sys._current_frames().get(self.main_id)
+                if frame is not None:
+                    st = traceback.extract_stack(frame)
+                    if st:
+                        samples += 1
+                        self._count(st, top, app_top)
+                        if random.randrange(samples) == 0:
+                            stack = st
+                del frame
+                sleep(STALL_SAMPLE_MS / 1000)
+
+            stalled = self.last_beat - beat - period
+            GUI_STALLS.observe(stalled)
+            self._log(stalled, samples, top, app_top, stack)
+
+    @staticmethod
+    def _count(st, top, app_top):
+        # Blame = innermost frame of each sample, plus the innermost frame
+        # that belongs to this file (the app code that made the call)
+        f = st[-1]
+        key = f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+        top[key] = top.get(key, 0) + 1
+        for f in reversed(st):
+            if f.filename == __file__:
+                key = f"{f.name} (line {f.lineno})"
+                app_top[key] = app_top.get(key, 0) + 1
+                break
+
+    def _log(self, stalled, samples, top, app_top, stack):
+        event = dict(
+            time=datetime.now().isoformat(timespec="milliseconds"),
+            duration_ms=round(stalled * 1000),
+            samples=samples,
+            app=sorted(app_top.items(), key=lambda kv: -kv[1])[:5],
+            top=sorted(top.items(), key=lambda kv: -kv[1])[:5],
+            stack=traceback.format_list(stack) if stack else [],
+        )
+        blame = event["app"][:1] or event["top"][:1]
+        print(f"GUI STALL {event['duration_ms']} ms:", blame)
+        with open(STALL_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+
 # ================= RUN =================
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     init_db()
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
+    start_metrics_server()
+    CACHE.warm()
     app = QApplication(sys.argv)
+    watchdog = StallWatchdog()
     w = Main()
     w.show()
     sys.exit(app.exec())